@@ -1,7 +1,13 @@
 """Module with Packt API client handling API's authentication."""
+import base64
+import json
 import logging
+import threading
+import time
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from .utils.logger import get_logger
 
@@ -18,32 +24,100 @@ PACKT_API_FREE_LEARNING_OFFERS_URL = 'https://services.packtpub.com/free-learnin
 PACKT_API_USER_URL = 'https://services.packtpub.com/users-v1/users/me'
 PACKT_API_FREE_LEARNING_CLAIM_URL = 'https://services.packtpub.com/free-learning-v1/users/{user_id}/claims/{offer_id}'
 DEFAULT_PAGINATION_SIZE = 25
+DEFAULT_POOL_SIZE = 20
+DEFAULT_REQUEST_TIMEOUT = (5, 60)  # (connect, read) timeouts in seconds
+JWT_EXPIRY_MARGIN = 60  # refresh JWT a minute before it expires to avoid clock skew issues
+JWT_ASSUMED_LIFETIME = 15 * 60  # used when JWT expiration time can't be read from the token
+JWT_FETCH_TIMEOUT = (5, 20)  # (connect, read) timeouts in seconds
+PACKT_API_USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) ' \
+    'Chrome/80.0.3987.149 Safari/537.36'
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+RETRY_METHODS = frozenset(['GET', 'PUT', 'POST'])
+# urllib3 1.26 renamed `method_whitelist` to `allowed_methods`
+RETRY_METHODS_ARGUMENT = 'allowed_methods' if hasattr(Retry, 'DEFAULT_ALLOWED_METHODS') else 'method_whitelist'
 
 
 class PacktAPIClient:
     """Packt API client making API requests on script's behalf."""
 
     def __init__(self, credentials):
-        self.session = requests.Session()
+        self.session = self.create_session()
         self.credentials = credentials
+        self._jwt_expiry = 0
+        self._jwt_lock = threading.Lock()
         self.fetch_jwt()
 
-    def fetch_jwt(self):
-        """Fetch user's JWT to be used when making Packt API requests."""
-        try:
-            response = requests.post(PACKT_API_LOGIN_URL, json=self.credentials)
-            jwt = response.json().get('data').get('access')
+    def close(self):
+        """Close connections kept alive in the session's pool."""
+        self.session.close()
+
+    @staticmethod
+    def create_session():
+        """Create a session with pooled connections retrying transient Packt API failures."""
+        session = requests.Session()
+        retry = Retry(
+            total=5,
+            backoff_factor=0.5,
+            status_forcelist=RETRY_STATUS_CODES,
+            raise_on_status=False,
+            respect_retry_after_header=True,
+            **{RETRY_METHODS_ARGUMENT: RETRY_METHODS}
+        )
+        adapter = HTTPAdapter(pool_connections=DEFAULT_POOL_SIZE, pool_maxsize=DEFAULT_POOL_SIZE, max_retries=retry)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update({'User-Agent': PACKT_API_USER_AGENT})
+        return session
+
+    def fetch_jwt(self, rejected_authorization=None):
+        """
+        Fetch user's JWT to be used when making Packt API requests.
+
+        Only one thread fetches JWT at a time, the others wait for it and reuse the token it has fetched.
+        If `rejected_authorization` is given, JWT is refreshed only if session still uses that authorization header,
+        otherwise the refresh happens only if current JWT is about to expire.
+        """
+        with self._jwt_lock:
+            if rejected_authorization is None:
+                if time.time() < self._jwt_expiry:
+                    return
+            elif self.session.headers.get('authorization') != rejected_authorization:
+                return
+
+            try:
+                jwt = self._request_jwt().json().get('data').get('access')
+                if not jwt:
+                    raise ValueError('Packt API response carries no access token.')
+            except Exception:
+                logger.error('Fetching JWT token failed!')
+                raise
             self.session.headers.update({'authorization': 'Bearer {}'.format(jwt)})
+            self._jwt_expiry = get_jwt_expiry(jwt) - JWT_EXPIRY_MARGIN
             logger.info('JWT token has been fetched successfully!')
-        except Exception:
-            logger.error('Fetching JWT token failed!')
+
+    def _request_jwt(self):
+        """Post user's credentials to a Packt API, network and server errors are retried by the session's adapter."""
+        response = self.session.post(PACKT_API_LOGIN_URL, json=self.credentials, timeout=JWT_FETCH_TIMEOUT)
+        response.raise_for_status()
+        return response
 
     def request(self, method, url, **kwargs):
         """Make a request to a Packt API."""
+        kwargs.setdefault('timeout', DEFAULT_REQUEST_TIMEOUT)
+        if time.time() >= self._jwt_expiry:
+            # Refresh JWT ahead of its expiration instead of waiting for a request to be rejected
+            try:
+                self.fetch_jwt()
+            except Exception:
+                # Current JWT may still be valid for a while, its rejection is handled below. Until it expires,
+                # requests don't try to refresh it ahead again.
+                self._jwt_expiry = time.time() + JWT_EXPIRY_MARGIN
+        authorization = self.session.headers.get('authorization')
         response = self.session.request(method, url, **kwargs)
         if response.status_code == 401:
             # Fetch a new JWT as the old one has expired and update session headers
-            self.fetch_jwt()
+            self.fetch_jwt(rejected_authorization=authorization)
             return self.session.request(method, url, **kwargs)
         else:
             return response
@@ -67,3 +141,13 @@ class PacktAPIClient:
     def delete(self, url, **kwargs):
         """Make a DELETE request to a Packt API."""
         return self.request('delete', url, **kwargs)
+
+
+def get_jwt_expiry(jwt):
+    """Return JWT expiration timestamp read from its payload or an assumed one if the payload can't be decoded."""
+    try:
+        payload = jwt.split('.')[1]
+        payload += '=' * (-len(payload) % 4)  # restore base64 padding stripped from JWT segments
+        return int(json.loads(base64.urlsafe_b64decode(payload).decode('utf-8'))['exp'])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return int(time.time()) + JWT_ASSUMED_LIFETIME
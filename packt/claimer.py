@@ -1,57 +1,151 @@
+from concurrent.futures import ThreadPoolExecutor
 import datetime as dt
 from itertools import chain
-from math import ceil
 from operator import itemgetter
+import time
 
 from .api import (
     DEFAULT_PAGINATION_SIZE,
+    DEFAULT_POOL_SIZE,
     PACKT_API_FREE_LEARNING_CLAIM_URL,
     PACKT_API_FREE_LEARNING_OFFERS_URL,
     PACKT_API_PRODUCTS_URL,
     PACKT_API_USER_URL,
     PACKT_PRODUCT_SUMMARY_URL
 )
+from .utils.cache import load_json_cache, save_json_cache
 from .utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+MAX_PAGES_FETCH_WORKERS = min(16, DEFAULT_POOL_SIZE)
+PRODUCTS_CACHE_MAX_AGE = 7 * 24 * 60 * 60  # products cache is rebuilt from Packt API once a week
+
 
 def get_all_books_data(api_client):
-    """Fetch all user's ebooks data."""
+    """Fetch all user's ebooks data, skipping pages which couldn't be fetched."""
+    return fetch_all_books_data(api_client)[0]
+
+
+def fetch_all_books_data(api_client):
+    """Fetch all user's ebooks data, return it along with information whether all its pages have been fetched."""
     logger.info("Getting your books data...")
     try:
-        response = api_client.get(PACKT_API_PRODUCTS_URL)
-        pages_total = int(ceil(response.json().get('count') / DEFAULT_PAGINATION_SIZE))
+        # First page response carries the total count as well, so it's reused instead of being fetched twice
+        first_page_data = fetch_books_page(api_client, 0).json()
+        pages_total = get_pages_total(first_page_data.get('count'))
+
+        # Pages are independent of each other, so fetch them concurrently over the pooled API session
+        with ThreadPoolExecutor(max_workers=max(1, min(pages_total - 1, MAX_PAGES_FETCH_WORKERS))) as executor:
+            pages = [parse_books_page_data(first_page_data)] + list(executor.map(
+                lambda page: get_single_page_books_data(api_client, page),
+                range(1, pages_total)
+            ))
 
         ids, my_books_data = (set(), [])
-        for book in chain(*map(lambda page: get_single_page_books_data(api_client, page), range(pages_total))):
+        # Pages which couldn't be fetched are skipped, so that a single failed page doesn't discard all the others
+        for book in chain.from_iterable(filter(None, pages)):
             if book['id'] not in ids:
                 ids.add(book['id'])
                 my_books_data.append(book)
 
-        logger.info('Books data has been successfully fetched.')
-        return my_books_data
+        failed_pages_count = sum(page is None for page in pages)
+        if failed_pages_count:
+            logger.error('Only part of books data has been fetched, {} of {} pages failed.'.format(
+                failed_pages_count,
+                pages_total
+            ))
+        else:
+            logger.info('Books data has been successfully fetched.')
+        return my_books_data, failed_pages_count == 0
     except (AttributeError, TypeError):
         logger.error('Couldn\'t fetch user\'s books data.')
+        return None, False
 
 
 def get_single_page_books_data(api_client, page):
     """Fetch ebooks data from single products API pagination page."""
     try:
-        response = api_client.get(
-            PACKT_API_PRODUCTS_URL,
-            params={
-                'sort': 'createdAt:DESC',
-                'offset': DEFAULT_PAGINATION_SIZE * page,
-                'limit': DEFAULT_PAGINATION_SIZE
-            }
-        )
-        return [{'id': t['productId'], 'title': t['productName']} for t in response.json().get('data')]
+        return parse_books_page_data(fetch_books_page(api_client, page).json())
     except Exception:
         logger.error('Couldn\'t fetch page {} of user\'s books data.'.format(page))
 
 
-def claim_product(api_client, recaptcha_solution):
+def iter_books_data(api_client):
+    """Lazily yield user's ebooks data, requesting next products page only when previous one is exhausted."""
+    page, pages_total = 0, 1
+    while page < pages_total:
+        page_data = fetch_books_page(api_client, page).json()
+        pages_total = get_pages_total(page_data.get('count'))
+        yield from parse_books_page_data(page_data)
+        page += 1
+
+
+def get_pages_total(count):
+    """Return number of products API pagination pages needed to list `count` products."""
+    return (count + DEFAULT_PAGINATION_SIZE - 1) // DEFAULT_PAGINATION_SIZE
+
+
+def fetch_books_page(api_client, page):
+    """Request single products API pagination page."""
+    return api_client.get(
+        PACKT_API_PRODUCTS_URL,
+        params={
+            'sort': 'createdAt:DESC',
+            'offset': DEFAULT_PAGINATION_SIZE * page,
+            'limit': DEFAULT_PAGINATION_SIZE
+        }
+    )
+
+
+def parse_books_page_data(page_data):
+    """Extract ebooks data from products API pagination page content."""
+    return [{'id': t['productId'], 'title': t['productName']} for t in page_data.get('data')]
+
+
+def is_product_claimed(api_client, product_id, products_cache_path=None):
+    """Check whether product is already in user's library, consulting products cache file if its path is given."""
+    if products_cache_path is not None:
+        return product_id in get_cached_product_ids(api_client, products_cache_path)
+    # Books are sorted from the newest ones, so the scan usually stops on the first page
+    return any(product_id == book['id'] for book in iter_books_data(api_client))
+
+
+def get_cached_product_ids(api_client, products_cache_path):
+    """Return ids of user's products stored in products cache file, rebuilding the cache when it's outdated."""
+    username = api_client.credentials.get('username')
+    products_cache = load_json_cache(products_cache_path) or {}
+    # Cache is valid only for the account it's been built for, as configuration's email may change
+    if products_cache.get('username') == username and \
+            time.time() - products_cache.get('fetched_at', 0) < PRODUCTS_CACHE_MAX_AGE:
+        return set(products_cache.get('ids', []))
+
+    books_data, is_complete = fetch_all_books_data(api_client)
+    if books_data is None:
+        # Claiming an already claimed offer is harmless, Packt API just rejects it with 409 status
+        return set()
+    product_ids = {book['id'] for book in books_data}
+    if not is_complete:
+        # Partial listing is good enough for this run, but cached it would hide missing products for a week
+        return product_ids
+    save_json_cache(
+        products_cache_path,
+        {'username': username, 'fetched_at': time.time(), 'ids': sorted(product_ids)}
+    )
+    return product_ids
+
+
+def add_product_to_cache(api_client, products_cache_path, product_id):
+    """Store claimed product's id in user's products cache file, if there is one."""
+    products_cache = load_json_cache(products_cache_path) if products_cache_path is not None else None
+    if products_cache is None or products_cache.get('username') != api_client.credentials.get('username'):
+        return
+    if product_id not in products_cache.get('ids', []):
+        products_cache['ids'] = products_cache.get('ids', []) + [product_id]
+        save_json_cache(products_cache_path, products_cache)
+
+
+def claim_product(api_client, recaptcha_solution, products_cache_path=None):
     """Grab Packt Free Learning ebook."""
     logger.info("Start grabbing ebook...")
 
@@ -63,30 +157,39 @@ def claim_product(api_client, recaptcha_solution):
             'dateTo': (utc_today + dt.timedelta(days=1)).isoformat()
         }
     )
+    offer_response_data = offer_response.json()
     # Handle case when there is no Free Learning offer
-    offer_count = offer_response.json().get('count')
-    if offer_count == 0:
+    if offer_response_data.get('count') == 0:
         logger.info("There is no Free Learning offer right now")
         raise Exception("There is no Free Learning offer right now")
 
     # Sometimes they are several offers. We just get the last updated one.
-    offer_data = max(offer_response.json().get('data'), key=itemgetter('updatedAt'))
+    offer_data = max(offer_response_data.get('data'), key=itemgetter('updatedAt'))
 
     offer_id = offer_data.get('id')
     product_id = offer_data.get('productId')
 
-    user_response = api_client.get(PACKT_API_USER_URL)
-    [user_data] = user_response.json().get('data')
-    user_id = user_data.get('id')
+    # Product's summary and the check whether it's already claimed are independent, so they run concurrently
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        product_response_future = executor.submit(
+            api_client.get,
+            PACKT_PRODUCT_SUMMARY_URL.format(product_id=product_id)
+        )
+        is_claimed_future = executor.submit(is_product_claimed, api_client, product_id, products_cache_path)
 
-    product_response = api_client.get(PACKT_PRODUCT_SUMMARY_URL.format(product_id=product_id))
+    product_response = product_response_future.result()
     product_data = {'id': product_id, 'title': product_response.json()['title']}\
         if product_response.status_code == 200 else None
 
-    if any(product_id == book['id'] for book in get_all_books_data(api_client)):
+    if is_claimed_future.result():
         logger.info('You have already claimed Packt Free Learning "{}" offer.'.format(product_data['title']))
         return product_data
 
+    # User's data is needed only to claim the offer, so it's fetched once the offer turns out to be unclaimed
+    user_response = api_client.get(PACKT_API_USER_URL)
+    [user_data] = user_response.json().get('data')
+    user_id = user_data.get('id')
+
     claim_response = api_client.put(
         PACKT_API_FREE_LEARNING_CLAIM_URL.format(user_id=user_id, offer_id=offer_id),
         json={'recaptcha': recaptcha_solution}
@@ -94,8 +197,10 @@ def claim_product(api_client, recaptcha_solution):
 
     if claim_response.status_code == 200:
         logger.info('A new Packt Free Learning ebook "{}" has been grabbed!'.format(product_data['title']))
+        add_product_to_cache(api_client, products_cache_path, product_id)
     elif claim_response.status_code == 409:
         logger.info('You have already claimed Packt Free Learning "{}" offer.'.format(product_data['title']))
+        add_product_to_cache(api_client, products_cache_path, product_id)
     else:
         logger.error('Claiming Packt Free Learning book has failed.')
 
@@ -1,39 +1,86 @@
 import configparser
+from functools import lru_cache
 import os
 
 from .utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+PRODUCTS_CACHE_FILE_NAME = 'products_cache.json'
+FILE_TYPES_CACHE_FILE_NAME = 'file_types_cache.json'
+
+try:
+    from functools import cached_property
+except ImportError:  # Python < 3.8
+    class cached_property(object):
+        """Minimal backport of `functools.cached_property` storing computed value in instance's `__dict__`."""
+
+        def __init__(self, func):
+            self.func = func
+            self.__doc__ = func.__doc__
+
+        def __get__(self, instance, owner=None):
+            if instance is None:
+                return self
+            value = instance.__dict__[self.func.__name__] = self.func(instance)
+            return value
+
+
+@lru_cache()
+def read_configuration(cfg_file_path, mtime):
+    """
+    Parse configuration file.
+
+    Results are cached by file path and modification time, so the file is parsed again only when it changes.
+    """
+    configuration = configparser.ConfigParser()
+    configuration.read(cfg_file_path)
+    return configuration
+
 
 class ConfigurationModel(object):
     """Contains all needed data stored in configuration file."""
 
     def __init__(self, cfg_file_path):
-        self.configuration = configparser.ConfigParser()
-        self.configuration.read(cfg_file_path)
+        self.cfg_file_path = cfg_file_path
+        mtime = os.path.getmtime(cfg_file_path) if os.path.isfile(cfg_file_path) else None
+        self.configuration = read_configuration(cfg_file_path, mtime)
+
+    def get_option(self, section, option):
+        """Return option's value, interpolating only the option which is read."""
+        return self.configuration.get(section, option)
 
-    @property
+    @cached_property
     def packt_login_credentials(self):
         """Return Packt user login credentials."""
         return {
-            'username': self.configuration.get('LOGIN_DATA', 'email'),
-            'password': self.configuration.get('LOGIN_DATA', 'password')
+            'username': self.get_option('LOGIN_DATA', 'email'),
+            'password': self.get_option('LOGIN_DATA', 'password')
         }
 
-    @property
+    @cached_property
+    def products_cache_path(self):
+        """Return path of the file caching user's products ids, stored next to the configuration file."""
+        return os.path.join(os.path.dirname(os.path.abspath(self.cfg_file_path)), PRODUCTS_CACHE_FILE_NAME)
+
+    @cached_property
+    def file_types_cache_path(self):
+        """Return path of the file caching file types of user's products, stored next to the configuration file."""
+        return os.path.join(os.path.dirname(os.path.abspath(self.cfg_file_path)), FILE_TYPES_CACHE_FILE_NAME)
+
+    @cached_property
     def anticaptcha_api_key(self):
         """Return AntiCaptcha API key."""
-        return self.configuration.get("ANTICAPTCHA_DATA", 'key')
+        return self.get_option("ANTICAPTCHA_DATA", 'key')
 
-    @property
+    @cached_property
     def config_download_data(self):
         """Return download configuration data."""
-        download_path = self.configuration.get("DOWNLOAD_DATA", 'download_folder_path')
+        download_path = self.get_option("DOWNLOAD_DATA", 'download_folder_path')
         if not os.path.exists(download_path):
             message = "Download folder path: '{}' doesn't exist".format(download_path)
             logger.error(message)
             raise ValueError(message)
         download_formats = tuple(form.replace(' ', '') for form in
-                                 self.configuration.get("DOWNLOAD_DATA", 'download_formats').split(','))
+                                 self.get_option("DOWNLOAD_DATA", 'download_formats').split(','))
         return download_path, download_formats
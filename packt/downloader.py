@@ -1,34 +1,45 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import chain
 import os
 import re
+import shutil
 import sys
+import threading
 import time
 
-import requests
 from requests.exceptions import ConnectionError
 from slugify import slugify
 
 from .api import (
+    DEFAULT_POOL_SIZE,
     PACKT_API_PRODUCT_FILE_DOWNLOAD_URL,
     PACKT_API_PRODUCT_FILE_TYPES_URL
 )
+from .utils.cache import load_json_cache, save_json_cache
 from .utils.logger import get_logger
 
 
 logger = get_logger(__name__)
 
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+MAX_DOWNLOAD_WORKERS = min(8, DEFAULT_POOL_SIZE)
+PRODUCT_NAME_DISALLOWED_CHARACTERS_PATTERN = re.compile(r'[^-a-zA-Z0-9\+\#\.\-\–]+')
+
 
 class PacktConnectionError(ConnectionError):
     """Error raised whenever fetching data from Packt API fails."""
     pass
 
 
+@lru_cache(maxsize=4096)
 def slugify_product_name(title):
     """Return book title with spaces replaced by underscore and unicodes replaced by characters valid in filenames."""
     return slugify(
         title,
         separator='_',
         lowercase=False,
-        regex_pattern=re.compile(r'[^-a-zA-Z0-9\+\#\.\-\–]+'),
+        regex_pattern=PRODUCT_NAME_DISALLOWED_CHARACTERS_PATTERN,
         replacements=[['–', '-']]
     )
 
@@ -54,89 +65,211 @@ def wait_for_computation(predicate, timeout, retry_after):
     return wrapper
 
 
-@wait_for_computation(lambda _: all(_.values()), 15.0, 0.75)
-def get_product_download_urls(api_client, product_id):
-    error_message = 'Couldn\'t fetch download URLs for product {}.'.format(product_id)
+@wait_for_computation(lambda _: all(_), 15.0, 0.75)
+def get_product_file_types(api_client, product_id):
+    error_message = 'Couldn\'t fetch file types of product {}.'.format(product_id)
     try:
         response = api_client.get(PACKT_API_PRODUCT_FILE_TYPES_URL.format(product_id=product_id))
         if response.status_code == 200:
-            return {
-                format: PACKT_API_PRODUCT_FILE_DOWNLOAD_URL.format(product_id=product_id, file_type=format)
-                for format in response.json().get('data')[0].get('fileTypes')
-            }
+            return response.json().get('data')[0].get('fileTypes')
         else:
             logger.info(error_message)
-            return {}
+            return []
     except Exception:
         raise PacktConnectionError(error_message)
 
 
-def download_products(api_client, download_directory, formats, product_list, into_folder=False):
-    """Download selected products."""
-    nr_of_books_downloaded = 0
-    is_interactive = sys.stdout.isatty()
-    for book in product_list:
-        download_urls = get_product_download_urls(api_client, book['id'])
-        for format, download_url in download_urls.items():
-            if format in formats and not (format == 'code' and 'video' in download_urls and 'video' in formats):
-                file_extention = 'zip' if format in ('video', 'code') else format
-                file_name = slugify_product_name(book['title'])
-                logger.info('Title: "{}"'.format(book['title']))
-                if into_folder:
-                    target_download_path = os.path.join(download_directory, file_name)
-                    if not os.path.isdir(target_download_path):
-                        os.mkdir(target_download_path)
-                else:
-                    target_download_path = os.path.join(download_directory)
-                full_file_path = os.path.join(target_download_path, '{}.{}'.format(file_name, file_extention))
-                temp_file_path = os.path.join(target_download_path, 'download.tmp')
-                if os.path.isfile(full_file_path):
-                    logger.info('"{}.{}" already exists under the given path.'.format(file_name, file_extention))
-                else:
-                    if format == 'code':
-                        logger.info('Downloading code for ebook: "{}"...'.format(book['title']))
-                    elif format == 'video':
-                        logger.info('Downloading "{}" video...'.format(book['title']))
-                    else:
-                        logger.info('Downloading ebook: "{}" in {} format...'.format(book['title'], format))
-                    try:
-                        file_url = api_client.get(download_url).json().get('data')
-                        r = api_client.get(file_url, timeout=100, stream=True)
-                        if r.status_code == 200:
-                            try:
-                                with open(temp_file_path, 'wb') as f:
-                                    total_length = int(r.headers.get('content-length'))
-                                    num_of_chunks = (total_length / 1024) + 1
-                                    for num, chunk in enumerate(r.iter_content(chunk_size=1024)):
-                                        if chunk:
-                                            if is_interactive:
-                                                update_download_progress_bar(num / num_of_chunks)
-                                            f.write(chunk)
-                                            f.flush()
-                                    if is_interactive:
-                                        update_download_progress_bar(-1)  # add end of line
-                                os.rename(temp_file_path, full_file_path)
-                            finally:
-                                if os.path.isfile(temp_file_path):
-                                    os.remove(temp_file_path)
-
-                            if format == 'code':
-                                logger.success('Code for ebook "{}" downloaded successfully!'.format(book['title']))
-                            else:
-                                logger.success('Ebook "{}" in {} format downloaded successfully!'.format(
-                                    book['title'],
-                                    format
-                                ))
-                            nr_of_books_downloaded += 1
-                        else:
-                            message = 'Couldn\'t download "{}" ebook in {} format.'.format(book['title'], format)
-                            logger.error(message)
-                            raise requests.exceptions.RequestException(message)
-                    except Exception as e:
-                        logger.error(e)
+def get_cached_product_download_urls(api_client, product_id, formats, file_types_cache=None):
+    """Return download URLs of product's files in given formats, asking Packt API only for products missing in cache."""
+    if file_types_cache is None or product_id not in file_types_cache:
+        file_types = get_product_file_types(api_client, product_id)
+        # All file types are cached, so that the cache stays valid when other formats are requested
+        if file_types_cache is not None and file_types:
+            file_types_cache[product_id] = file_types
+    else:
+        file_types = file_types_cache[product_id]
+    return {
+        format: PACKT_API_PRODUCT_FILE_DOWNLOAD_URL.format(product_id=product_id, file_type=format)
+        for format in file_types if format in formats
+    }
+
+
+def download_products(api_client, download_directory, formats, product_list, into_folder=False,
+                      file_types_cache_path=None):
+    """Download selected products, caching their available file types if cache file path is given."""
+    # Progress bars of concurrent downloads would overwrite each other, so it's shown only for a single product
+    # whose files are then downloaded one by one
+    is_interactive = sys.stdout.isatty() and len(product_list) == 1
+    formats = frozenset(formats)  # checked for every format of every product
+    # All products share download directory unless they're downloaded into separate folders, so it's listed just once
+    existing_file_names = None if into_folder else list_file_names(download_directory)
+    file_types_cache = (load_json_cache(file_types_cache_path) or {}) if file_types_cache_path is not None else None
+    cached_products_count = len(file_types_cache) if file_types_cache is not None else 0
+    with ThreadPoolExecutor(max_workers=MAX_DOWNLOAD_WORKERS) as executor:
+        download_tasks = list(chain.from_iterable(executor.map(
+            lambda book: get_product_download_tasks(
+                api_client,
+                download_directory,
+                formats,
+                book,
+                into_folder,
+                existing_file_names,
+                file_types_cache
+            ),
+            product_list
+        )))
+        download_tasks = drop_duplicate_download_tasks(download_tasks)
+        if file_types_cache is not None and len(file_types_cache) != cached_products_count:
+            save_json_cache(file_types_cache_path, file_types_cache)
+        # Files are downloaded independently of the product they belong to, so that the workers stay busy
+        # even if the library holds a few big videos among many small ebooks
+        nr_of_books_downloaded = sum((map if is_interactive else executor.map)(
+            lambda download_task: download_product_file(api_client, *download_task, is_interactive=is_interactive),
+            download_tasks
+        ))
     logger.info("{} ebooks have been downloaded!".format(str(nr_of_books_downloaded)))
 
 
+def get_product_download_tasks(api_client, download_directory, formats, book, into_folder, existing_file_names=None,
+                               file_types_cache=None):
+    """Return (book, format, download URL, file path) tuples for product's files which are still to be downloaded."""
+    file_name = slugify_product_name(book['title'])
+    target_download_path = os.path.join(download_directory, file_name) if into_folder else download_directory
+    if existing_file_names is None:
+        existing_file_names = list_file_names(target_download_path)
+    if are_product_files_downloaded(file_name, formats, existing_file_names):
+        logger.info('"{}" already exists under the given path in all selected formats.'.format(book['title']))
+        return []
+
+    download_tasks = []
+    download_urls = get_cached_product_download_urls(api_client, book['id'], formats, file_types_cache)
+    for format, download_url in download_urls.items():
+        if not (format == 'code' and 'video' in download_urls):
+            full_file_name = '{}.{}'.format(file_name, get_file_extension(format))
+            if full_file_name in existing_file_names:
+                logger.info('"{}" already exists under the given path.'.format(full_file_name))
+            else:
+                download_tasks.append((book, format, download_url, os.path.join(target_download_path, full_file_name)))
+    if into_folder and download_tasks:
+        os.makedirs(target_download_path, exist_ok=True)
+    return download_tasks
+
+
+def drop_duplicate_download_tasks(download_tasks):
+    """Return download tasks without the ones saving into a file path already taken by a preceding task."""
+    # Products whose titles slugify to the same name would be downloaded into the same file at the same time
+    taken_file_paths, unique_download_tasks = (set(), [])
+    for download_task in download_tasks:
+        book, format, _, full_file_path = download_task
+        if full_file_path in taken_file_paths:
+            logger.info('"{}" in {} format would overwrite "{}", skipping it.'.format(
+                book['title'],
+                format,
+                full_file_path
+            ))
+        else:
+            taken_file_paths.add(full_file_path)
+            unique_download_tasks.append(download_task)
+    return unique_download_tasks
+
+
+def download_product_file(api_client, book, format, download_url, full_file_path, is_interactive=False):
+    """Download product's file in given format, return whether it has been downloaded."""
+    logger.info('Title: "{}"'.format(book['title']))
+    if format == 'code':
+        logger.info('Downloading code for ebook: "{}"...'.format(book['title']))
+    elif format == 'video':
+        logger.info('Downloading "{}" video...'.format(book['title']))
+    else:
+        logger.info('Downloading ebook: "{}" in {} format...'.format(book['title'], format))
+    # Temporary file is unique to the downloading thread, so that concurrent downloads never write into the same one
+    temp_file_path = '{}.{}-{}.tmp'.format(full_file_path, os.getpid(), threading.get_ident())
+    try:
+        file_url = api_client.get(download_url).json().get('data')
+        r = api_client.get(file_url, timeout=100, stream=True)
+        if r.status_code != 200:
+            r.close()
+            logger.error('Couldn\'t download "{}" ebook in {} format.'.format(book['title'], format))
+            return False
+
+        try:
+            with open(temp_file_path, 'xb') as f:
+                save_response_content(r, f, is_interactive)
+                if hasattr(os, 'posix_fadvise'):
+                    # Downloaded files aren't read again, so pages already written to disk are dropped from the page
+                    # cache; the still dirty ones stay until written back, as syncing them would stall the download
+                    f.flush()
+                    try:
+                        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+                    except OSError:
+                        pass  # only a hint, the file is downloaded anyway
+            os.rename(temp_file_path, full_file_path)
+        finally:
+            if os.path.isfile(temp_file_path):
+                os.remove(temp_file_path)
+
+        if format == 'code':
+            logger.success('Code for ebook "{}" downloaded successfully!'.format(book['title']))
+        else:
+            logger.success('Ebook "{}" in {} format downloaded successfully!'.format(book['title'], format))
+        return True
+    except Exception as e:
+        logger.error(e)
+        return False
+
+
+def save_response_content(response, file, is_interactive):
+    """Write streamed response's content into given file, displaying progress bar in interactive mode."""
+    # Content is copied by shutil instead of iterating over it in Python, progress is tracked by the written file
+    response.raw.decode_content = True
+    if is_interactive:
+        file = ProgressBarFileWriter(file, int(response.headers.get('content-length', 0)))
+    shutil.copyfileobj(response.raw, file, DOWNLOAD_CHUNK_SIZE)
+    if is_interactive:
+        update_download_progress_bar(-1)  # add end of line
+
+
+class ProgressBarFileWriter(object):
+    """File writer wrapper updating download progress bar with number of bytes written into the file."""
+
+    def __init__(self, file, total_length):
+        self.file = file
+        self.total_length = max(total_length, 1)
+        self.bytes_written = 0
+        self.last_percentage = -1
+
+    def write(self, data):
+        written = self.file.write(data)
+        self.bytes_written += len(data)
+        # Redraw progress bar only when its displayed percentage changes
+        percentage = min(self.bytes_written * 100 // self.total_length, 100)
+        if percentage != self.last_percentage:
+            update_download_progress_bar(percentage / 100)
+            self.last_percentage = percentage
+        return written
+
+
+def get_file_extension(format):
+    """Return extension of the file a product in given format is saved to."""
+    return 'zip' if format in ('video', 'code') else format
+
+
+def are_product_files_downloaded(file_name, formats, existing_file_names):
+    """Check whether files of the product in all selected formats already exist, without asking Packt API."""
+    return all(
+        '{}.{}'.format(file_name, file_extension) in existing_file_names
+        for file_extension in {get_file_extension(format) for format in formats}
+    )
+
+
+def list_file_names(directory):
+    """Return names of files in given directory, listed with a single directory scan."""
+    try:
+        return {entry.name for entry in os.scandir(directory) if entry.is_file()}
+    except FileNotFoundError:
+        return set()
+
+
 def update_download_progress_bar(current_work_done):
     """Prints progress bar, current_work_done should be float value in range {0.0 - 1.0}, else prints '\n'"""
     if 0.0 <= current_work_done <= 1.0:
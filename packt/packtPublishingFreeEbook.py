@@ -6,7 +6,7 @@ import sys
 from .api import PacktAPIClient
 from .claimer import claim_product, get_all_books_data
 from .configuration import ConfigurationModel
-from .downloader import download_products, slugify_product_name
+from .downloader import download_products, get_file_extension, slugify_product_name
 from .utils.anticaptcha import solve_recaptcha
 from .utils.logger import get_logger
 
@@ -49,6 +49,7 @@ PACKT_RECAPTCHA_SITE_KEY = '6LeAHSgUAAAAAKsn5jo6RUSTLVxGNYyuvUcLMe0_'
 def packt_cli(cfgpath, grab, grabd, dall, sgd, mail, status_mail, folder, noauth_local_webserver):
     config_file_path = cfgpath
     into_folder = folder
+    api_client = None
 
     try:
         cfg = ConfigurationModel(config_file_path)
@@ -58,7 +59,7 @@ def packt_cli(cfgpath, grab, grabd, dall, sgd, mail, status_mail, folder, noauth
 
         # Grab the newest book
         if grab or grabd or sgd or mail:
-            product_data = claim_product(api_client, recaptcha_solution)
+            product_data = claim_product(api_client, recaptcha_solution, cfg.products_cache_path)
 
             # Send email about successful book grab. Do it only when book
             # isn't going to be emailed as we don't want to send email twice.
@@ -85,7 +86,8 @@ def packt_cli(cfgpath, grab, grabd, dall, sgd, mail, status_mail, folder, noauth
                     download_directory,
                     formats,
                     get_all_books_data(api_client),
-                    into_folder=into_folder
+                    into_folder=into_folder,
+                    file_types_cache_path=cfg.file_types_cache_path
                 )
             elif grabd:
                 download_products(api_client, download_directory, formats, [product_data], into_folder=into_folder)
@@ -94,10 +96,15 @@ def packt_cli(cfgpath, grab, grabd, dall, sgd, mail, status_mail, folder, noauth
 
         # Send downloaded book(s) by mail or to Google Drive.
         if sgd or mail:
+            # DirEntry.is_file() reuses file type read while listing the directory instead of calling stat() again
+            # Only files named exactly as the downloaded ones are sent and removed afterwards, so that other files
+            # sharing the name's prefix are left untouched
+            file_name = slugify_product_name(product_data['title'])
+            downloaded_file_names = {'{}.{}'.format(file_name, get_file_extension(format)) for format in formats}
             paths = [
-                os.path.join(download_directory, path)
-                for path in os.listdir(download_directory)
-                if os.path.isfile(path) and slugify_product_name(product_data['title']) in path
+                entry.path
+                for entry in os.scandir(download_directory)
+                if entry.is_file() and entry.name in downloaded_file_names
             ]
             if sgd:
                 from .utils.google_drive import GoogleDriveManager
@@ -106,19 +113,17 @@ def packt_cli(cfgpath, grab, grabd, dall, sgd, mail, status_mail, folder, noauth
             else:
                 from .utils.mail import MailBook
                 mb = MailBook(config_file_path)
-                pdf_path = None
-                mobi_path = None
-                try:
-                    pdf_path = [path for path in paths if path.endswith('.pdf')][-1]
-                    mobi_path = [path for path in paths if path.endswith('.mobi')][-1]
-                except IndexError:
-                    pass
+                pdf_path = next((path for path in reversed(paths) if path.endswith('.pdf')), None)
+                mobi_path = next((path for path in reversed(paths) if path.endswith('.mobi')), None)
                 if pdf_path:
                     mb.send_book(pdf_path)
                 if mobi_path:
                     mb.send_kindle(mobi_path)
             for path in paths:
-                os.remove(path)
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
 
         logger.success("Good, looks like all went well! :-)")
     except Exception as e:
@@ -131,3 +136,6 @@ def packt_cli(cfgpath, grab, grabd, dall, sgd, mail, status_mail, folder, noauth
                 body=FAILURE_EMAIL_BODY.format(str(e))
             )
         sys.exit(2)
+    finally:
+        if api_client is not None:
+            api_client.close()
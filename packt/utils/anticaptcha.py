@@ -20,12 +20,17 @@ class Anticaptcha(object):
     More info concerning the API: https://anti-captcha.com/apidoc/
     """
     timeout = 120  # Timeout in second - during busy periods, we may need to wait about 2 minutes to solve ReCAPTCHA.
+    first_poll_delay = 5  # anti-captcha.com advises against asking for the task result earlier
+    poll_delay = 2.0  # Initial delay between polls, growing by poll_delay_multiplier up to max_poll_delay seconds
+    poll_delay_multiplier = 1.5
+    max_poll_delay = 10
 
     def __init__(self, api_key):
         self.api_key = api_key
+        self.session = requests.Session()  # keeps connection alive between task result polls
 
     def __post_request(self, url, **kwargs):
-        response = requests.post(url, **kwargs).json()
+        response = self.session.post(url, **kwargs).json()
         if response.get('errorId'):
             raise AnticaptchaException("Error {0} occured: {1}".format(
                 response.get('errorCode'),
@@ -51,11 +56,14 @@ class Anticaptcha(object):
             'clientKey': self.api_key,
             'taskId': task_id
         }
+        delay = self.poll_delay
+        time.sleep(self.first_poll_delay)
         while (time.time() - start_time) < self.timeout:
             response = self.__post_request(GET_TASK_API_URL, json=content)
             if response.get('status') == 'ready':
                 return response
-            time.sleep(1)
+            time.sleep(min(delay, self.max_poll_delay))
+            delay *= self.poll_delay_multiplier
         raise AnticaptchaException('Timeout {} reached '.format(self.timeout))
 
     def solve_recaptcha(self, website_url, website_key):
@@ -0,0 +1,26 @@
+import json
+import os
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def load_json_cache(cache_file_path):
+    """Return data stored in JSON cache file or None if the file doesn't exist or can't be read."""
+    try:
+        with open(cache_file_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_json_cache(cache_file_path, data):
+    """Replace JSON cache file content with given data, so that the file is never left half-written."""
+    temp_file_path = '{}.tmp'.format(cache_file_path)
+    try:
+        with open(temp_file_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(temp_file_path, cache_file_path)
+    except OSError as e:
+        logger.error('Couldn\'t save cache file {}: {}'.format(cache_file_path, e))
@@ -177,7 +177,7 @@ class GoogleDriveManager(object):
         fh = io.FileIO(file_name, 'wb')
         downloader = MediaIoBaseDownload(fh, request)
         done = False
-        while done is False:
+        while not done:
             status, done = downloader.next_chunk()
             logger.debug("Download %d%%." % int(status.progress() * 100))
 